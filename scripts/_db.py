@@ -0,0 +1,154 @@
+"""Shared Postgres connection handling for the Python migration scripts.
+
+One pool is created per process and reused by every script and helper that imports
+this module. psycopg2 never creates server-side prepared statements and the
+migration lock is transaction-level, so DATABASE_URL may point at a PgBouncer
+transaction pooler (Neon -pooler or Supabase pooler endpoints) as well.
+"""
+import atexit
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+from psycopg2.pool import ThreadedConnectionPool
+
+POOL_MAX_CONNECTIONS = 4
+
+# Shared by every migration script so only one of them runs DDL at a time
+MIGRATION_LOCK_NAME = 'resumate_migrate'
+
+# How often a waiting migration retries the lock
+LOCK_RETRY_SECONDS = 2
+
+# TCP keepalives keep long DDL phases alive across cloud NAT/LB idle timeouts.
+# statement_timeout is disabled for long DDL, while lock_timeout stops a migration
+# from queueing forever behind a writer.
+CONNECT_KWARGS = {
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 5,
+    'connect_timeout': 10,
+    'options': '-c statement_timeout=0 -c lock_timeout=5000 -c idle_in_transaction_session_timeout=600000',
+}
+
+_pool = None
+
+
+def _connect_params():
+    """Split DATABASE_URL into a query-less DSN and libpq keyword parameters.
+
+    Parameters given in the URL win over CONNECT_KWARGS, except options, which are
+    appended so a URL-provided endpoint= option does not drop the session settings.
+    """
+    url = urlsplit(os.environ['DATABASE_URL'])
+    query = dict(parse_qsl(url.query))
+    params = {**CONNECT_KWARGS, **query}
+    if 'options' in query:
+        params['options'] = f"{CONNECT_KWARGS['options']} {query['options']}"
+    return urlunsplit(url._replace(query='')), params
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        dsn, params = _connect_params()
+        _pool = ThreadedConnectionPool(1, POOL_MAX_CONNECTIONS, dsn=dsn, **params)
+        atexit.register(close_pool)
+    return _pool
+
+
+def close_pool():
+    """Close every pooled connection; the next get_pool() call starts a fresh pool"""
+    global _pool
+    if _pool is not None and not _pool.closed:
+        _pool.closeall()
+    _pool = None
+
+
+@contextmanager
+def get_cursor(cursor_factory=None, name=None):
+    """Yield a cursor on a pooled connection, committing on success and rolling back on error.
+
+    Passing a name opens a server-side cursor that streams rows in batches of itersize;
+    use it only for large read-only results, never for DDL.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn.cursor(name=name, cursor_factory=cursor_factory)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+@contextmanager
+def get_connection(autocommit=False):
+    """Yield a pooled connection, returning it to the pool afterwards"""
+    pool = get_pool()
+    conn = pool.getconn()
+    conn.autocommit = autocommit
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            conn.autocommit = False
+        pool.putconn(conn)
+
+
+def execute_in_parallel(statement_groups):
+    """Run each group of statements on its own autocommit connection, groups in parallel.
+
+    Meant for CREATE INDEX CONCURRENTLY, which cannot run inside a transaction block.
+    Statements within a group run in order; keep builds on the same table in one group,
+    since concurrent builds on a single table wait on each other's locks anyway.
+    """
+    def run_group(statements):
+        with get_connection(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                # A concurrent build waits for every older snapshot as well as table locks;
+                # under the session lock_timeout any app transaction over 5 s would abort it
+                cursor.execute("SET lock_timeout = 0")
+                try:
+                    for statement in statements:
+                        cursor.execute(statement)
+                finally:
+                    # The connection goes back to the pool, so restore the session setting
+                    if not conn.closed:
+                        cursor.execute("RESET lock_timeout")
+
+    # Leave one pooled connection for the caller, e.g. the advisory lock holder
+    with ThreadPoolExecutor(max_workers=min(len(statement_groups), POOL_MAX_CONNECTIONS - 1)) as executor:
+        # list() drains the results so the first failure is re-raised here
+        list(executor.map(run_group, statement_groups))
+
+
+def try_advisory_xact_lock(conn, name=MIGRATION_LOCK_NAME, wait=False):
+    """Take a transaction-level advisory lock as the first statement of conn's transaction.
+
+    Returns True once acquired; the lock is held until that transaction ends. Returns
+    False if another session holds it, unless wait is set, in which case it retries
+    every LOCK_RETRY_SECONDS, each attempt in a fresh short transaction, so a waiter
+    never holds a snapshot that the holder's CREATE INDEX CONCURRENTLY would wait for.
+    Unlike a session lock this stays correct behind a transaction pooler. The key is
+    derived server-side with hashtext(), since Python's str hash differs per process.
+    """
+    announced = False
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (name,))
+            if cursor.fetchone()[0]:
+                return True
+            conn.rollback()
+            if not wait:
+                return False
+            if not announced:
+                print("⏳ Another migration is in progress; waiting for the lock...")
+                announced = True
+            time.sleep(LOCK_RETRY_SECONDS)
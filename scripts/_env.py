@@ -0,0 +1,39 @@
+"""Minimal .env loader for the Python migration scripts.
+
+Understands KEY=VALUE lines with an optional export prefix, quoted values and
+trailing # comments on unquoted values; this avoids importing python-dotenv on
+every script start. Multi-line values and ${VAR} expansion are not supported.
+"""
+import os
+
+
+def load_env_file(path='.env.local'):
+    """Load KEY=VALUE pairs from path into os.environ without overriding existing values"""
+    # Nothing to do when the connection string already comes from the environment (e.g. CI)
+    if os.environ.get('DATABASE_URL'):
+        return
+    # Open directly instead of checking existence first: one filesystem call, not two
+    try:
+        env_file = open(path, encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with env_file:
+        for line in env_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('export '):
+                line = line[len('export '):]
+            key, sep, value = line.partition('=')
+            key = key.strip()
+            # Lines without = or with an empty key (e.g. "=value") are ignored
+            if sep and key:
+                os.environ.setdefault(key, _parse_value(value.strip()))
+
+
+def _parse_value(value):
+    """Unquote a quoted value, or drop a trailing # comment from an unquoted one"""
+    if value[:1] in ('"', "'"):
+        closing = value.find(value[0], 1)
+        return value[1:closing] if closing != -1 else value[1:]
+    return value.split(' #', 1)[0].split('\t#', 1)[0].rstrip()
@@ -0,0 +1,587 @@
+"""Schema migration phases shared by setup-database.py and run-migration.py.
+
+apply_all() runs the schema setup and the foreign key fixes on one connection and
+commits them as a single transaction; only CREATE INDEX CONCURRENTLY builds, which
+cannot run inside a transaction block, happen after the commit.
+"""
+from pathlib import Path
+
+from psycopg2 import sql
+
+from _db import execute_in_parallel, try_advisory_xact_lock
+
+# Tables estimated above this many rows get their indexes built with CREATE INDEX CONCURRENTLY
+CONCURRENT_INDEX_MIN_ROWS = 10000
+
+# Static DDL for the resumes table, sent to the server in the same batch as the
+# job_analysis foreign key fix
+RESUMES_MIGRATION_FILE = Path(__file__).resolve().parent / 'fix-resumes-table.sql'
+
+
+def index_statement(table, name, columns, unique=False, using=None, concurrently=False):
+    """Compose CREATE INDEX IF NOT EXISTS DDL with properly quoted identifiers"""
+    return sql.SQL("CREATE {unique}INDEX {concurrently}IF NOT EXISTS {name} ON {table}{using} ({columns})").format(
+        unique=sql.SQL("UNIQUE " if unique else ""),
+        concurrently=sql.SQL("CONCURRENTLY " if concurrently else ""),
+        name=sql.Identifier(name),
+        table=sql.Identifier(table),
+        using=sql.SQL(f" USING {using}" if using else ""),
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+    )
+
+
+def index_build_statements(index, invalid_indexes, concurrently=False):
+    """Return the DDL that (re)builds one index spec.
+
+    IF NOT EXISTS would skip an INVALID index left behind by a failed concurrent build,
+    so any index named in invalid_indexes is dropped first and built again.
+    """
+    statements = []
+    if index['name'] in invalid_indexes:
+        statements.append(sql.SQL("DROP INDEX {concurrently}IF EXISTS {name}").format(
+            concurrently=sql.SQL("CONCURRENTLY " if concurrently else ""),
+            name=sql.Identifier(index['name']),
+        ))
+    statements.append(index_statement(**index, concurrently=concurrently))
+    return statements
+
+
+def _build_setup_phase():
+    """Return the setup statements, index specs and progress labels for the full schema"""
+    # Every statement is collected so the whole phase is sent in a single execute
+    stmts = []
+    indexes = []
+    steps = []
+
+    # Enable UUID extension
+    stmts.append("CREATE EXTENSION IF NOT EXISTS \"uuid-ossp\"")
+    steps.append("UUID extension enabled")
+
+    # Create users_sync table
+    stmts.append("""
+        CREATE TABLE IF NOT EXISTS users_sync (
+            id VARCHAR(255) PRIMARY KEY DEFAULT gen_random_uuid()::text,
+            clerk_user_id VARCHAR(255) UNIQUE,
+            email VARCHAR(255) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            subscription_status VARCHAR(50) DEFAULT 'free',
+            subscription_plan VARCHAR(50) DEFAULT 'free',
+            subscription_period_end TIMESTAMP WITH TIME ZONE,
+            stripe_customer_id VARCHAR(255),
+            stripe_subscription_id VARCHAR(255),
+            deleted_at TIMESTAMP WITH TIME ZONE,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+    """)
+    steps.append("Users table created")
+
+    # Create indexes for users_sync
+    indexes.append(dict(table='users_sync', name='idx_users_sync_clerk_user_id', columns=['clerk_user_id']))
+    indexes.append(dict(table='users_sync', name='idx_users_sync_email', columns=['email']))
+    indexes.append(dict(table='users_sync', name='idx_users_sync_deleted_at', columns=['deleted_at']))
+    steps.append("User table indexes created")
+
+    # Create resumes table
+    stmts.append("""
+        CREATE TABLE IF NOT EXISTS resumes (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            user_id TEXT NOT NULL REFERENCES users_sync(id) ON DELETE CASCADE,
+            title VARCHAR(255) NOT NULL,
+            file_name VARCHAR(255) NOT NULL,
+            file_url TEXT NOT NULL,
+            file_type VARCHAR(100) NOT NULL,
+            file_size INTEGER NOT NULL,
+            content_text TEXT,
+            kind VARCHAR(32) NOT NULL DEFAULT 'uploaded',
+            processing_status VARCHAR(32) NOT NULL DEFAULT 'completed',
+            processing_error TEXT,
+            parsed_sections JSONB,
+            extracted_at TIMESTAMP WITH TIME ZONE,
+            source_metadata JSONB,
+            is_primary BOOLEAN DEFAULT false,
+            deleted_at TIMESTAMP WITH TIME ZONE,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+    """)
+    steps.append("Resumes table created")
+
+    # Create indexes for resumes
+    indexes.append(dict(table='resumes', name='idx_resumes_user_id', columns=['user_id']))
+    indexes.append(dict(table='resumes', name='idx_resumes_is_primary', columns=['is_primary']))
+    indexes.append(dict(table='resumes', name='idx_resumes_deleted_at', columns=['deleted_at']))
+    indexes.append(dict(table='resumes', name='idx_resumes_kind', columns=['kind']))
+    indexes.append(dict(table='resumes', name='idx_resumes_processing_status', columns=['processing_status']))
+    steps.append("Resume table indexes created")
+
+    # Create job_targets table for onboarding job URLs
+    stmts.append("""
+        CREATE TABLE IF NOT EXISTS job_targets (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            user_id VARCHAR(255) NOT NULL REFERENCES users_sync(id) ON DELETE CASCADE,
+            job_url TEXT NOT NULL,
+            job_title VARCHAR(255),
+            company_name VARCHAR(255),
+            status VARCHAR(50) DEFAULT 'pending',
+            notes TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+    """)
+    indexes.append(dict(table='job_targets', name='idx_job_targets_user_id', columns=['user_id']))
+    indexes.append(dict(table='job_targets', name='idx_job_targets_user_url', columns=['user_id', 'job_url'], unique=True))
+    steps.append("Job targets table created")
+
+    # Ensure master resume processing columns exist
+    # One DO block looks up each column once and skips steps that are already applied,
+    # so reruns avoid the backfill UPDATE and SET NOT NULL scans
+    stmts.append("""
+        DO $$
+        DECLARE
+            col_nullable TEXT;
+            col_default TEXT;
+        BEGIN
+            SELECT is_nullable, column_default INTO col_nullable, col_default
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'resumes' AND column_name = 'kind';
+            IF NOT FOUND THEN
+                -- Metadata-only on PG 11+: existing rows read the default, nothing to backfill
+                ALTER TABLE resumes ADD COLUMN kind VARCHAR(32) NOT NULL DEFAULT 'uploaded';
+            ELSIF col_default IS DISTINCT FROM '''uploaded''::character varying' THEN
+                ALTER TABLE resumes ALTER COLUMN kind SET DEFAULT 'uploaded';
+            END IF;
+            -- Legacy nullable column: backfill only if needed, then enforce NOT NULL
+            IF col_nullable = 'YES' THEN
+                -- Skip the full-table UPDATE when no row needs backfilling
+                IF EXISTS (SELECT 1 FROM resumes WHERE kind IS NULL) THEN
+                    UPDATE resumes SET kind = 'uploaded' WHERE kind IS NULL;
+                END IF;
+                ALTER TABLE resumes ALTER COLUMN kind SET NOT NULL;
+            END IF;
+
+            SELECT is_nullable, column_default INTO col_nullable, col_default
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'resumes' AND column_name = 'processing_status';
+            IF NOT FOUND THEN
+                ALTER TABLE resumes ADD COLUMN processing_status VARCHAR(32) NOT NULL DEFAULT 'completed';
+            ELSIF col_default IS DISTINCT FROM '''completed''::character varying' THEN
+                ALTER TABLE resumes ALTER COLUMN processing_status SET DEFAULT 'completed';
+            END IF;
+            IF col_nullable = 'YES' THEN
+                IF EXISTS (SELECT 1 FROM resumes WHERE processing_status IS NULL) THEN
+                    UPDATE resumes SET processing_status = 'completed' WHERE processing_status IS NULL;
+                END IF;
+                ALTER TABLE resumes ALTER COLUMN processing_status SET NOT NULL;
+            END IF;
+        END $$
+    """)
+
+    stmts.append("ALTER TABLE resumes ADD COLUMN IF NOT EXISTS processing_error TEXT")
+    stmts.append("ALTER TABLE resumes ADD COLUMN IF NOT EXISTS parsed_sections JSONB")
+    stmts.append("ALTER TABLE resumes ADD COLUMN IF NOT EXISTS extracted_at TIMESTAMP WITH TIME ZONE")
+    stmts.append("ALTER TABLE resumes ADD COLUMN IF NOT EXISTS source_metadata JSONB")
+    steps.append("Master resume columns ensured")
+
+    # Create job_analysis table
+    stmts.append("""
+        CREATE TABLE IF NOT EXISTS job_analysis (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            user_id TEXT NOT NULL REFERENCES users_sync(id) ON DELETE CASCADE,
+            job_title VARCHAR(255) NOT NULL,
+            company_name VARCHAR(255),
+            job_url TEXT,
+            job_description TEXT NOT NULL,
+            analysis_result JSONB NOT NULL,
+            keywords TEXT[] DEFAULT '{}',
+            required_skills TEXT[] DEFAULT '{}',
+            preferred_skills TEXT[] DEFAULT '{}',
+            experience_level VARCHAR(100),
+            salary_range VARCHAR(100),
+            location VARCHAR(255),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+    """)
+    steps.append("Job analysis table created")
+
+    # Create indexes for job_analysis
+    indexes.append(dict(table='job_analysis', name='idx_job_analysis_user_id', columns=['user_id']))
+    indexes.append(dict(table='job_analysis', name='idx_job_analysis_keywords', columns=['keywords'], using='GIN'))
+    indexes.append(dict(table='job_analysis', name='idx_job_analysis_required_skills', columns=['required_skills'], using='GIN'))
+    steps.append("Job analysis table indexes created")
+
+    # Create optimized_resumes table
+    stmts.append("""
+        CREATE TABLE IF NOT EXISTS optimized_resumes (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            user_id VARCHAR(255) NOT NULL REFERENCES users_sync(id) ON DELETE CASCADE,
+            original_resume_id UUID NOT NULL REFERENCES resumes(id) ON DELETE CASCADE,
+            job_analysis_id UUID NOT NULL REFERENCES job_analysis(id) ON DELETE CASCADE,
+            title VARCHAR(255) NOT NULL,
+            optimized_content TEXT NOT NULL,
+            optimization_summary JSONB NOT NULL,
+            match_score INTEGER,
+            improvements_made TEXT[] DEFAULT '{}',
+            keywords_added TEXT[] DEFAULT '{}',
+            skills_highlighted TEXT[] DEFAULT '{}',
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+    """)
+    steps.append("Optimized resumes table created")
+
+    # Create indexes for optimized_resumes
+    indexes.append(dict(table='optimized_resumes', name='idx_optimized_resumes_user_id', columns=['user_id']))
+    indexes.append(dict(table='optimized_resumes', name='idx_optimized_resumes_original_resume_id', columns=['original_resume_id']))
+    indexes.append(dict(table='optimized_resumes', name='idx_optimized_resumes_job_analysis_id', columns=['job_analysis_id']))
+    steps.append("Optimized resumes table indexes created")
+
+    # Create user_profiles table
+    stmts.append("""
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            clerk_user_id VARCHAR(255) NOT NULL UNIQUE,
+            user_id VARCHAR(255) NOT NULL REFERENCES users_sync(id) ON DELETE CASCADE,
+            bio TEXT,
+            company VARCHAR(255),
+            job_title VARCHAR(255),
+            experience_level VARCHAR(100),
+            skills TEXT[] DEFAULT '{}',
+            preferences JSONB DEFAULT '{}',
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+    """)
+    steps.append("User profiles table created")
+
+    # Create indexes for user_profiles
+    indexes.append(dict(table='user_profiles', name='idx_user_profiles_clerk_user_id', columns=['clerk_user_id']))
+    indexes.append(dict(table='user_profiles', name='idx_user_profiles_user_id', columns=['user_id']))
+    steps.append("User profiles table indexes created")
+
+    # Create job_applications table
+    stmts.append("""
+        CREATE TABLE IF NOT EXISTS job_applications (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            user_id VARCHAR(255) NOT NULL REFERENCES users_sync(id) ON DELETE CASCADE,
+            resume_id UUID NOT NULL REFERENCES resumes(id) ON DELETE CASCADE,
+            job_title VARCHAR(255) NOT NULL,
+            company_name VARCHAR(255) NOT NULL,
+            job_url TEXT,
+            job_description TEXT,
+            status VARCHAR(50) DEFAULT 'pending',
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+    """)
+    steps.append("Job applications table created")
+
+    # Create indexes for job_applications
+    indexes.append(dict(table='job_applications', name='idx_job_applications_user_id', columns=['user_id']))
+    indexes.append(dict(table='job_applications', name='idx_job_applications_resume_id', columns=['resume_id']))
+    steps.append("Job applications table indexes created")
+
+    # Create clerk_webhook_events table
+    stmts.append("""
+        CREATE TABLE IF NOT EXISTS clerk_webhook_events (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            event_type VARCHAR(100) NOT NULL,
+            event_id VARCHAR(255) NOT NULL UNIQUE,
+            user_id VARCHAR(255),
+            processed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            raw_data JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+    """)
+    steps.append("Webhook events table created")
+
+    # Create indexes for webhook events
+    indexes.append(dict(table='clerk_webhook_events', name='idx_clerk_webhook_events_event_type', columns=['event_type']))
+    indexes.append(dict(table='clerk_webhook_events', name='idx_clerk_webhook_events_user_id', columns=['user_id']))
+    indexes.append(dict(table='clerk_webhook_events', name='idx_clerk_webhook_events_created_at', columns=['created_at']))
+    steps.append("Webhook events table indexes created")
+
+    # Create update trigger function
+    stmts.append("""
+        CREATE OR REPLACE FUNCTION update_updated_at_column()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.updated_at = NOW();
+            RETURN NEW;
+        END;
+        $$ language 'plpgsql'
+    """)
+    steps.append("Update trigger function created")
+
+    # Create triggers for all tables
+    tables_with_updated_at = [
+        'users_sync', 'resumes', 'job_targets', 'job_applications', 
+        'job_analysis', 'optimized_resumes', 'user_profiles'
+    ]
+
+    # One DO block runs the same CREATE OR REPLACE TRIGGER (PG 14+) template for every
+    # table, instead of a separately parsed statement per table
+    stmts.append(f"""
+        DO $$
+        DECLARE
+            t text;
+        BEGIN
+            FOREACH t IN ARRAY ARRAY[{', '.join(f"'{table}'" for table in tables_with_updated_at)}] LOOP
+                EXECUTE format(
+                    'CREATE OR REPLACE TRIGGER update_%I_updated_at BEFORE UPDATE ON %I '
+                    'FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()',
+                    t, t
+                );
+            END LOOP;
+        END $$
+    """)
+    steps.append(f"Update triggers created for {len(tables_with_updated_at)} tables")
+    return stmts, indexes, steps
+
+
+# Built once at import; the setup phase is the same static DDL on every run
+SETUP_STATEMENTS, SETUP_INDEXES, SETUP_STEPS = _build_setup_phase()
+
+SCHEMA_STATE_SQL = """
+    WITH cols AS (
+        -- pg_attribute rather than information_schema.columns: an index lookup with no
+        -- privilege-filter joins, and format_type() already includes the length
+        SELECT t.table_name, a.attname AS column_name, format_type(a.atttypid, a.atttypmod) AS data_type
+        FROM (VALUES ('users_sync', %(users_sync)s::oid, 'id'),
+                     ('job_analysis', %(job_analysis)s::oid, 'user_id')) AS t(table_name, relid, column_name)
+        JOIN pg_attribute a
+          ON a.attrelid = t.relid
+         AND a.attname = t.column_name
+         AND NOT a.attisdropped
+    ),
+    fks AS (
+        SELECT conname
+        FROM pg_constraint
+        WHERE conrelid = %(job_analysis)s::oid AND contype = 'f'
+    )
+    SELECT json_build_object(
+        'cols', (SELECT json_agg(c) FROM cols c),
+        'fks', (SELECT json_agg(f) FROM fks f)
+    ) AS result
+"""
+
+ADD_JOB_ANALYSIS_FK_SQL = """
+    ALTER TABLE job_analysis 
+    ADD CONSTRAINT job_analysis_user_id_fkey 
+    FOREIGN KEY (user_id) REFERENCES users_sync(id) ON DELETE CASCADE
+"""
+
+# Existence check only: stops at the first orphan instead of counting them all
+ORPHAN_CHECK_SQL = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM job_analysis ja
+        WHERE ja.user_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM users_sync u WHERE u.id = ja.user_id)
+    ) AS has_orphan
+"""
+
+# Server-side guard so the foreign key can be added in the same batch as the checks:
+# the whole transaction aborts with this message if any orphan exists
+ORPHAN_GUARD_SQL = f"""
+    DO $$
+    BEGIN
+        IF ({ORPHAN_CHECK_SQL}) THEN
+            RAISE EXCEPTION 'Orphaned job_analysis.user_id records exist'
+                USING HINT = 'Resolve orphaned job_analysis.user_id records before adding the foreign key.';
+        END IF;
+    END $$
+"""
+
+# Post-migration verification: schema state and orphan check in one round-trip
+VERIFICATION_SQL = f"""
+    SELECT state.result, orphan.has_orphan
+    FROM ({SCHEMA_STATE_SQL}) AS state, ({ORPHAN_CHECK_SQL}) AS orphan
+"""
+
+
+def fetch_schema_state(cursor, table_oids):
+    """Return the users_sync.id/job_analysis.user_id column info and job_analysis foreign keys.
+
+    table_oids maps table names to the OIDs resolved by the pre-flight check, so the
+    query binds them directly instead of re-resolving each name.
+    """
+    cursor.execute(SCHEMA_STATE_SQL, table_oids)
+    return parse_schema_state(cursor.fetchone()[0])
+
+
+def parse_schema_state(state):
+    """Split the schema-state JSON into columns keyed by table.column and foreign keys"""
+    columns = {f"{col['table_name']}.{col['column_name']}": col for col in state['cols'] or []}
+    return columns, state['fks'] or []
+
+
+def read_resumes_migration():
+    """Return the static resumes DDL; call it before connecting so a bad file fails fast"""
+    resumes_sql = RESUMES_MIGRATION_FILE.read_text(encoding='utf-8')
+    if not resumes_sql.strip():
+        raise Exception(f"{RESUMES_MIGRATION_FILE.name} is empty")
+    return resumes_sql
+
+
+def _run_setup_phase(cursor):
+    """Create every table, column, function and trigger of the base schema"""
+    cursor.execute(";\n".join(SETUP_STATEMENTS))
+    print("\n".join(f"✓ {step}" for step in SETUP_STEPS))
+
+
+def _run_foreign_key_phase(cursor, resumes_sql):
+    """Align users_sync.id references to TEXT and re-create their foreign keys.
+
+    Returns the OIDs of users_sync, job_analysis and resumes, keyed by table name.
+    """
+    # The setup phase guarantees the tables exist; resolve their OIDs once
+    cursor.execute("""
+        SELECT to_regclass('public.users_sync')::oid AS users_sync,
+               to_regclass('public.job_analysis')::oid AS job_analysis,
+               to_regclass('public.resumes')::oid AS resumes
+    """)
+    table_oids = dict(zip(('users_sync', 'job_analysis', 'resumes'), cursor.fetchone()))
+
+    print("\n📊 Checking current schema state...")
+
+    # Column types and foreign keys in a single round-trip
+    columns, constraints = fetch_schema_state(cursor, table_oids)
+
+    print(f"users_sync.id: {columns['users_sync.id']['data_type'] if 'users_sync.id' in columns else 'NOT FOUND'}")
+    print(f"job_analysis.user_id: {columns['job_analysis.user_id']['data_type'] if 'job_analysis.user_id' in columns else 'NOT FOUND'}")
+
+    print(f"\n🔗 Current foreign key constraints: {len(constraints)}")
+    if constraints:
+        print("\n".join(f"  - {constraint['conname']}" for constraint in constraints))
+
+    print("\n🔧 Running migration...")
+
+    # Every step is queued and sent to the server as one batch
+    batch = []
+    job_analysis_type = columns.get('job_analysis.user_id', {}).get('data_type')
+    constraint_names = {constraint['conname'] for constraint in constraints}
+
+    # Re-adding the foreign key validates every row under an ACCESS EXCLUSIVE lock, so
+    # steps 1-3 are skipped once the column is TEXT and only the current constraint exists
+    if (job_analysis_type == 'text'
+            and 'job_analysis_user_id_fkey' in constraint_names
+            and 'fk_job_analysis_user_id' not in constraint_names):
+        print("  1-3. job_analysis.user_id type and foreign key already up to date, skipping rebuild")
+    else:
+        # Step 1: Drop existing foreign key constraints
+        print("  1. Dropping existing foreign key constraints...")
+        batch.append("ALTER TABLE job_analysis DROP CONSTRAINT IF EXISTS fk_job_analysis_user_id")
+        batch.append("ALTER TABLE job_analysis DROP CONSTRAINT IF EXISTS job_analysis_user_id_fkey")
+
+        # Step 2: Ensure data type consistency
+        # TEXT matches resumes.user_id and is binary-coercible from VARCHAR, so the change
+        # needs neither a length pre-check nor a table rewrite; skip it entirely on reruns
+        if job_analysis_type == 'text':
+            print("  2. job_analysis.user_id type already compatible, skipping rewrite")
+        else:
+            print("  2. Updating job_analysis.user_id data type to TEXT...")
+            batch.append("ALTER TABLE job_analysis ALTER COLUMN user_id TYPE TEXT")
+
+        # Step 3: Re-create foreign key constraint, aborting if orphaned records exist
+        print("  3. Checking for orphaned job_analysis.user_id and creating new foreign key constraint...")
+        batch.append(ORPHAN_GUARD_SQL)
+        batch.append(ADD_JOB_ANALYSIS_FK_SQL)
+
+    # Step 4: Fix resumes table foreign key data type; the setup phase already
+    # ensured the master resume columns
+    print("\n🔧 Fixing resumes table foreign key data type...")
+    batch.append(resumes_sql)
+
+    cursor.execute(";\n".join(batch))
+    return table_oids
+
+
+def _run_index_phase(cursor):
+    """Build indexes on small tables in the transaction.
+
+    Indexes on empty or small tables build instantly; only tables past the threshold
+    need non-blocking CONCURRENTLY builds, which must wait until after the commit.
+    Returns the large table names and the names of INVALID setup indexes.
+    """
+    index_tables = sorted({index['table'] for index in SETUP_INDEXES})
+    # reltuples is -1 for a table that was never analyzed (PG 14+); such a table is only
+    # treated as small when it is actually empty, e.g. created earlier in this transaction
+    cursor.execute("""
+        SELECT relname
+        FROM pg_class
+        WHERE relnamespace = 'public'::regnamespace
+          AND relname = ANY(%s)
+          AND (reltuples > %s OR (reltuples < 0 AND pg_relation_size(oid) > 0))
+    """, (index_tables, CONCURRENT_INDEX_MIN_ROWS))
+    large_tables = {relname for (relname,) in cursor}
+
+    # Left behind by failed CREATE INDEX CONCURRENTLY builds
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relnamespace = 'public'::regnamespace
+          AND c.relname = ANY(%s)
+          AND NOT i.indisvalid
+    """, ([index['name'] for index in SETUP_INDEXES],))
+    invalid_indexes = {relname for (relname,) in cursor}
+
+    small_indexes = [statement
+                     for index in SETUP_INDEXES if index['table'] not in large_tables
+                     for statement in index_build_statements(index, invalid_indexes)]
+    if small_indexes:
+        cursor.execute(sql.SQL(";\n").join(small_indexes))
+    return large_tables, invalid_indexes
+
+
+def apply_all(conn, resumes_sql, wait=False):
+    """Apply every migration phase on conn and return the migrated tables' OIDs.
+
+    The setup, foreign key and index phases share one transaction that is committed
+    once; indexes on large tables are then built concurrently. conn must be a pooled
+    connection with autocommit off, and resumes_sql the result of read_resumes_migration().
+    Returns None without changing anything if another migration holds the lock, unless
+    wait is set, in which case it waits for that migration to finish first.
+    """
+    # Only one migration runs DDL at a time; the transaction-level lock is released at COMMIT
+    if not try_advisory_xact_lock(conn, wait=wait):
+        print("⏳ Another migration is in progress; skipping.")
+        return None
+
+    try:
+        with conn.cursor() as cursor:
+            # Every phase is idempotent, so skipping the commit fsync wait is safe:
+            # a lost commit is repaired by simply rerunning the migration
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            _run_setup_phase(cursor)
+            table_oids = _run_foreign_key_phase(cursor, resumes_sql)
+            large_tables, invalid_indexes = _run_index_phase(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block; builds on the
+    # same table share a connection, separate tables build in parallel
+    if large_tables:
+        # conn holds the lock again in an otherwise idle transaction while the builds run
+        # on other pooled connections; an idle READ COMMITTED transaction keeps no
+        # snapshot, so the builds do not wait on it
+        try_advisory_xact_lock(conn, wait=True)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL idle_in_transaction_session_timeout = 0")
+            print("\n🗂️ Creating indexes concurrently...")
+            execute_in_parallel([
+                [statement
+                 for index in SETUP_INDEXES if index['table'] == large_table
+                 for statement in index_build_statements(index, invalid_indexes, concurrently=True)]
+                for large_table in sorted(large_tables)
+            ])
+        finally:
+            conn.rollback()
+
+    return table_oids
@@ -0,0 +1,22 @@
+-- Fix resumes table foreign key data type
+-- Executed as a single batch by scripts/_migrate.py, inside the same
+-- transaction as the schema setup (which owns the master resume columns)
+-- and the job_analysis foreign key fix.
+
+-- Legacy tables declared resumes.user_id as VARCHAR(255); only those are
+-- converted, so fresh and already-migrated tables skip the ALTER TYPE and
+-- the foreign key re-validation scan
+DO $$
+BEGIN
+    IF (
+        SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = 'public.resumes'::regclass AND attname = 'user_id'
+          AND NOT attisdropped
+    ) IS DISTINCT FROM 'text' THEN
+        ALTER TABLE resumes DROP CONSTRAINT IF EXISTS resumes_user_id_fkey;
+        ALTER TABLE resumes ALTER COLUMN user_id TYPE TEXT;
+        ALTER TABLE resumes
+        ADD CONSTRAINT resumes_user_id_fkey
+        FOREIGN KEY (user_id) REFERENCES users_sync(id) ON DELETE CASCADE;
+    END IF;
+END $$;
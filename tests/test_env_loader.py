@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+from _env import load_env_file  # noqa: E402
+
+
+class LoadEnvFileTest(unittest.TestCase):
+    def load(self, contents):
+        """Load contents as an env file into a clean environment and return the result"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / '.env.local'
+            path.write_text(contents, encoding='utf-8')
+            with mock.patch.dict(os.environ, {}, clear=True):
+                load_env_file(str(path))
+                return dict(os.environ)
+
+    def test_strips_export_prefix(self):
+        env = self.load("export DATABASE_URL=postgres://db/app\n")
+        self.assertEqual(env, {'DATABASE_URL': 'postgres://db/app'})
+
+    def test_keeps_hash_inside_quotes(self):
+        env = self.load('SECRET="abc # def" # trailing\nOTHER=\'x#y\'\n')
+        self.assertEqual(env['SECRET'], 'abc # def')
+        self.assertEqual(env['OTHER'], 'x#y')
+
+    def test_drops_inline_comment_from_unquoted_value(self):
+        env = self.load("DATABASE_URL=postgres://db/app # prod\nTABBED=value\t# note\n")
+        self.assertEqual(env['DATABASE_URL'], 'postgres://db/app')
+        self.assertEqual(env['TABBED'], 'value')
+
+    def test_keeps_hash_without_preceding_whitespace(self):
+        env = self.load("DATABASE_URL=postgres://db/app#anchor\n")
+        self.assertEqual(env['DATABASE_URL'], 'postgres://db/app#anchor')
+
+    def test_ignores_empty_key_comment_and_blank_lines(self):
+        env = self.load("# comment\n\n=value\nNOT_AN_ASSIGNMENT\nKEY=kept\n")
+        self.assertEqual(env, {'KEY': 'kept'})
+
+    def test_does_not_override_existing_values(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / '.env.local'
+            path.write_text("FOO=from_file\nBAR=from_file\n", encoding='utf-8')
+            with mock.patch.dict(os.environ, {'FOO': 'from_env'}, clear=True):
+                load_env_file(str(path))
+                self.assertEqual(os.environ['FOO'], 'from_env')
+                self.assertEqual(os.environ['BAR'], 'from_file')
+
+    def test_skips_file_when_database_url_is_set(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / '.env.local'
+            path.write_text("FOO=from_file\n", encoding='utf-8')
+            with mock.patch.dict(os.environ, {'DATABASE_URL': 'postgres://env'}, clear=True):
+                load_env_file(str(path))
+                self.assertNotIn('FOO', os.environ)
+
+    def test_missing_file_is_ignored(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with mock.patch.dict(os.environ, {}, clear=True):
+                load_env_file(str(Path(tmp) / 'missing.env'))
+                self.assertEqual(dict(os.environ), {})
+
+
+if __name__ == '__main__':
+    unittest.main()